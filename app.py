@@ -1,25 +1,31 @@
+import json
 import os
+import threading
+import time
 from datetime import datetime
 from functools import wraps
 
-import psycopg2
-import psycopg2.extras
-from dotenv import load_dotenv
 from flask import (
     Flask,
     abort,
     flash,
     g,
+    has_app_context,
     redirect,
     render_template,
     request,
     session,
     url_for,
 )
-from vercel_blob import delete, put
 from werkzeug.utils import secure_filename
 
-load_dotenv()
+# psycopg2 / vercel_blob 均在首次使用时才导入。
+# 快速启动模式：先开始接收请求、后台预热；数据库地址已由部署平台注入时才跳过 .env
+FAST_START = os.environ.get("PEACEPET_FAST_START") == "1"
+if not (FAST_START and os.environ.get("POSTGRES_URL_NON_POOLING")):
+    from dotenv import load_dotenv
+
+    load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = os.environ.get(
@@ -46,6 +52,21 @@ FONT_OPTIONS = [
 ]
 
 
+# --- Blob Storage (lazy) ---
+
+# 仅后台上传/删除图片时需要，避免启动时加载 vercel_blob 及其 HTTP 依赖
+def put(*args, **kwargs):
+    from vercel_blob import put as blob_put
+
+    return blob_put(*args, **kwargs)
+
+
+def delete(*args, **kwargs):
+    from vercel_blob import delete as blob_delete
+
+    return blob_delete(*args, **kwargs)
+
+
 # --- Database and Auth ---
 
 
@@ -58,12 +79,118 @@ def inject_common():
     }
 
 
+# 每个请求最多同时持有一个连接；连接池满时等待而不是直接报错。
+# 连接池只保留 DB_POOL_MIN 个空闲连接，多出的归还时即关闭，故默认与服务器线程数一致
+SERVER_THREADS = int(os.environ.get("SERVER_THREADS", 4))
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", SERVER_THREADS))
+DB_POOL_MAX = max(int(os.environ.get("DB_POOL_MAX", 10)), DB_POOL_MIN)
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+_db_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+
+def get_db_pool():
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                import psycopg2.extras
+                import psycopg2.pool
+
+                _db_pool = psycopg2.pool.ThreadedConnectionPool(
+                    DB_POOL_MIN,
+                    DB_POOL_MAX,
+                    os.environ.get("POSTGRES_URL_NON_POOLING"),
+                    cursor_factory=psycopg2.extras.DictCursor,
+                )
+    return _db_pool
+
+
+def _checkout_live_conn(pool):
+    import psycopg2
+
+    # 空闲连接可能已被数据库端断开（closed 只在查询失败后才置位），取出时先探活
+    for _ in range(DB_POOL_MAX + 1):
+        conn = pool.getconn()
+        try:
+            conn.autocommit = True
+            conn.cursor().execute("SELECT 1")
+            conn.autocommit = False
+            return conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError("no live database connection available")
+
+
 def get_db_conn():
-    conn = psycopg2.connect(os.environ.get("POSTGRES_URL_NON_POOLING"))
-    conn.cursor_factory = psycopg2.extras.DictCursor
+    pool = get_db_pool()
+    if not _db_pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+        import psycopg2.pool
+
+        raise psycopg2.pool.PoolError("timed out waiting for a database connection")
+    try:
+        conn = _checkout_live_conn(pool)
+    except Exception:
+        _db_pool_slots.release()
+        raise
+    if has_app_context():
+        g.setdefault("_db_conns", []).append(conn)
     return conn
 
 
+def _return_db_conn(conn):
+    try:
+        get_db_pool().putconn(conn)
+    finally:
+        _db_pool_slots.release()
+
+
+def release_db_conn(conn):
+    if has_app_context() and conn in g.get("_db_conns", []):
+        g._db_conns.remove(conn)
+    _return_db_conn(conn)
+
+
+@app.teardown_appcontext
+def release_leaked_conns(exc):
+    # abort() 或提前 return 的请求未归还的连接在此统一归还
+    for conn in g.pop("_db_conns", []):
+        _return_db_conn(conn)
+
+
+# 导航分类与站点设置几乎每个请求都要用，进程内缓存并在后台修改时失效
+NAV_CACHE_TTL = int(os.environ.get("NAV_CACHE_TTL", 60))
+_nav_cache = {"snapshot": None, "loaded_at": 0.0}
+
+
+def load_nav_cache(force=False):
+    # 返回 (categories, settings) 快照；失效时只重置时间戳，旧快照在重新加载前仍可用
+    snapshot = _nav_cache["snapshot"]
+    if (
+        not force
+        and snapshot is not None
+        and time.monotonic() - _nav_cache["loaded_at"] < NAV_CACHE_TTL
+    ):
+        return snapshot
+    conn = get_db_conn()
+    c = conn.cursor()
+    c.execute("SELECT * FROM categories ORDER BY sort_order DESC, id DESC")
+    categories = c.fetchall()
+    c.execute("SELECT * FROM settings")
+    settings = {row["key"]: row["value"] for row in c.fetchall()}
+    release_db_conn(conn)
+    snapshot = (categories, settings)
+    _nav_cache.update(snapshot=snapshot, loaded_at=time.monotonic())
+    return snapshot
+
+
+def invalidate_nav_cache():
+    # 仅作用于当前进程；其他 worker 最多在 NAV_CACHE_TTL 秒后刷新
+    _nav_cache["loaded_at"] = 0.0
+
+
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -75,21 +202,197 @@ def admin_required(f):
     return decorated_function
 
 
+# --- Materialized Collections ---
+
+# 前台商品栏目：在商品增/改/删时预先计算并写入 collections 表，
+# 前台页面只读取已排好序的 id 列表和卡片数据。新增栏目只需在此添加配置。
+COLLECTIONS = {
+    "featured": {"where": "is_featured = 1", "order_by": "id DESC", "limit": 6},
+    "deals": {"where": "is_deal = 1", "order_by": "id DESC", "limit": None},
+    "new": {"where": "is_new = 1", "order_by": "id DESC", "limit": None},
+    "best_selling": {
+        "where": "monthly_sales > 0",
+        "order_by": "monthly_sales DESC, id DESC",
+        "limit": 8,
+    },
+    # avg_rating 默认 5.0，只有收到过评价的商品才参与排名
+    "top_rated": {
+        "where": "id IN (SELECT product_id FROM feedback)",
+        "order_by": "avg_rating DESC, id DESC",
+        "limit": 8,
+    },
+}
+CATEGORY_COLLECTION = {
+    "where": "category_id = %s",
+    "order_by": "id DESC",
+    "limit": None,
+}
+CARD_FIELDS = ["id", "title_en", "title_zh", "price", "main_image"]
+
+# 首页依次展示的栏目；新增首页栏目只需在此添加一项
+HOME_RAILS = [
+    {
+        "collection": "featured",
+        "title_en": "Featured Essentials",
+        "title_zh": "精选产品",
+    },
+    {
+        "collection": "best_selling",
+        "title_en": "Best Sellers",
+        "title_zh": "热销产品",
+    },
+    {
+        "collection": "top_rated",
+        "title_en": "Top Rated",
+        "title_zh": "好评产品",
+    },
+]
+
+# 重建栏目时持有的事务级 advisory lock，避免并发写入互相覆盖
+COLLECTIONS_LOCK_KEY = 260026
+
+_collections_table_ready = False
+
+
+def ensure_collections_table(c):
+    # 在调用方的事务中建表，调用前须已持有 COLLECTIONS_LOCK_KEY，避免并发建表冲突
+    if not _collections_table_ready:
+        c.execute(
+            "CREATE TABLE IF NOT EXISTS collections (name TEXT PRIMARY KEY, product_ids TEXT NOT NULL DEFAULT '', cards TEXT NOT NULL DEFAULT '[]', updated_at TEXT)"
+        )
+
+
+def create_collections_table(conn):
+    global _collections_table_ready
+    c = conn.cursor()
+    c.execute("SELECT pg_advisory_xact_lock(%s)", (COLLECTIONS_LOCK_KEY,))
+    ensure_collections_table(c)
+    conn.commit()
+    _collections_table_ready = True
+
+
+def category_collection_name(cat_id):
+    return f"category:{int(cat_id)}"
+
+
+def build_collection(c, name):
+    if name.startswith("category:"):
+        spec, params = CATEGORY_COLLECTION, (int(name.split(":", 1)[1]),)
+    else:
+        spec, params = COLLECTIONS[name], ()
+    sql = f"SELECT {', '.join(CARD_FIELDS)} FROM products"
+    if spec["where"]:
+        sql += f" WHERE {spec['where']}"
+    sql += f" ORDER BY {spec['order_by']}"
+    if spec["limit"]:
+        sql += f" LIMIT {int(spec['limit'])}"
+    c.execute(sql, params)
+    cards = [dict(row) for row in c.fetchall()]
+    c.execute(
+        "INSERT INTO collections (name, product_ids, cards, updated_at) VALUES (%s, %s, %s, %s) ON CONFLICT (name) DO UPDATE SET product_ids = EXCLUDED.product_ids, cards = EXCLUDED.cards, updated_at = EXCLUDED.updated_at",
+        (
+            name,
+            ",".join(str(card["id"]) for card in cards),
+            json.dumps(cards, default=str),
+            datetime.now().strftime("%Y-%m-%d %H:%M"),
+        ),
+    )
+    return cards
+
+
+def refresh_collections(c, category_ids=()):
+    # 使用调用方的 cursor，与触发它的商品写入在同一事务中提交
+    c.execute("SELECT pg_advisory_xact_lock(%s)", (COLLECTIONS_LOCK_KEY,))
+    ensure_collections_table(c)
+    for name in COLLECTIONS:
+        build_collection(c, name)
+    for cat_id in {str(cat_id) for cat_id in category_ids if cat_id}:
+        build_collection(c, category_collection_name(cat_id))
+
+
+def get_collection(conn, name):
+    global _collections_table_ready
+    import psycopg2.errors
+
+    c = conn.cursor()
+    try:
+        c.execute("SELECT cards FROM collections WHERE name = %s", (name,))
+    except psycopg2.errors.UndefinedTable:
+        # 未经 warmup 的实例（如 serverless）在表尚不存在时建表一次
+        conn.rollback()
+        create_collections_table(conn)
+        c.execute("SELECT cards FROM collections WHERE name = %s", (name,))
+    _collections_table_ready = True
+    row = c.fetchone()
+    if row:
+        return json.loads(row["cards"])
+    # 首次访问（如部署后尚未有写入）时补建一次
+    c.execute("SELECT pg_advisory_xact_lock(%s)", (COLLECTIONS_LOCK_KEY,))
+    cards = build_collection(c, name)
+    conn.commit()
+    return cards
+
+
 # --- App Lifecycle ---
 
+_ready = threading.Event()
+_warmup_lock = threading.Lock()
+_warmup_started = False
+
+
+def warmup():
+    # 预编译全部模板、建立连接池、预热分类/设置缓存
+    global _warmup_started
+    try:
+        with app.app_context():
+            for name in app.jinja_env.list_templates():
+                app.jinja_env.get_template(name)
+            # 同时取出 DB_POOL_MIN 个连接（取出时已探活），归还后均留在池中
+            conns = [get_db_conn() for _ in range(DB_POOL_MIN)]
+            create_collections_table(conns[0])
+            for conn in conns:
+                release_db_conn(conn)
+            load_nav_cache(force=True)
+    except Exception:
+        # 例如扩容启动时数据库尚不可达：记录错误，下一次 /readyz 会重新预热
+        app.logger.exception("Warmup failed")
+        with _warmup_lock:
+            _warmup_started = False
+        return False
+    _ready.set()
+    return True
+
+
+def start_warmup():
+    global _warmup_started
+    with _warmup_lock:
+        if _warmup_started:
+            return
+        _warmup_started = True
+    threading.Thread(target=warmup, name="warmup", daemon=True).start()
+
 
 @app.before_request
 def set_language_and_nav():
+    if request.endpoint in ("healthz", "readyz"):
+        return
     if "lang" not in session:
         session["lang"] = "en"
     g.lang = session["lang"]
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("SELECT * FROM categories ORDER BY sort_order DESC, id DESC")
-    g.categories = c.fetchall()
-    c.execute("SELECT * FROM settings")
-    g.settings = {row["key"]: row["value"] for row in c.fetchall()}
-    conn.close()
+    g.categories, g.settings = load_nav_cache()
+
+
+@app.route("/healthz")
+def healthz():
+    return "OK"
+
+
+@app.route("/readyz")
+def readyz():
+    if not _ready.is_set():
+        start_warmup()
+        return "Warming up", 503
+    return "OK"
 
 
 # --- Auth Routes ---
@@ -135,11 +438,12 @@ def switch_lang(new_lang):
 @app.route("/")
 def index():
     conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("SELECT * FROM products WHERE is_featured = 1 ORDER BY id DESC LIMIT 6")
-    products = c.fetchall()
-    conn.close()
-    return render_template("index.html", products=products)
+    rails = [
+        dict(rail, products=get_collection(conn, rail["collection"]))
+        for rail in HOME_RAILS
+    ]
+    release_db_conn(conn)
+    return render_template("index.html", rails=rails)
 
 
 @app.route("/about")
@@ -175,37 +479,32 @@ def catalog_index():
 @app.route("/deals")
 def deals():
     conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("SELECT * FROM products WHERE is_deal = 1 ORDER BY id DESC")
-    products = c.fetchall()
-    conn.close()
+    products = get_collection(conn, "deals")
+    release_db_conn(conn)
     return render_template("deals.html", products=products)
 
 
 @app.route("/new_arrivals")
 def new_arrivals():
     conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("SELECT * FROM products WHERE is_new = 1 ORDER BY id DESC")
-    products = c.fetchall()
-    conn.close()
+    products = get_collection(conn, "new")
+    release_db_conn(conn)
     return render_template("new_arrivals.html", products=products)
 
 
 @app.route("/catalog/<slug>")
 def category_detail(slug):
+    category = next((cat for cat in g.categories if cat["slug"] == slug), None)
     conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("SELECT * FROM categories WHERE slug = %s", (slug,))
-    category = c.fetchone()
     if not category:
-        abort(404)
-    c.execute(
-        "SELECT * FROM products WHERE category_id = %s ORDER BY id DESC",
-        (category["id"],),
-    )
-    products = c.fetchall()
-    conn.close()
+        # 导航缓存可能来自其他 worker 修改之前，未命中时再查一次数据库
+        c = conn.cursor()
+        c.execute("SELECT * FROM categories WHERE slug = %s", (slug,))
+        category = c.fetchone()
+        if not category:
+            abort(404)
+    products = get_collection(conn, category_collection_name(category["id"]))
+    release_db_conn(conn)
     return render_template("category_detail.html", products=products, category=category)
 
 
@@ -221,7 +520,7 @@ def product_detail(product_id):
         "SELECT * FROM feedback WHERE product_id = %s ORDER BY id DESC", (product_id,)
     )
     reviews = c.fetchall()
-    conn.close()
+    release_db_conn(conn)
     bullets_field = f"bullet_points_{g.lang}"
     bullets = product[bullets_field].split("\n") if product[bullets_field] else []
     a_plus_imgs = (
@@ -251,7 +550,7 @@ def submit_order():
         ),
     )
     conn.commit()
-    conn.close()
+    release_db_conn(conn)
     return "OK"
 
 
@@ -272,8 +571,14 @@ def delete_category(cat_id):
         except Exception as e:
             flash(f"Could not delete image from blob storage: {e}", "error")
     c.execute("DELETE FROM categories WHERE id = %s", (cat_id,))
+    ensure_collections_table(c)
+    c.execute(
+        "DELETE FROM collections WHERE name = %s", (category_collection_name(cat_id),)
+    )
+    refresh_collections(c)
     conn.commit()
-    conn.close()
+    release_db_conn(conn)
+    invalidate_nav_cache()
     return redirect(url_for("admin", tab="categories"))
 
 
@@ -283,7 +588,8 @@ def delete_product(product_id):
     conn = get_db_conn()
     c = conn.cursor()
     c.execute(
-        "SELECT main_image, a_plus_images FROM products WHERE id = %s", (product_id,)
+        "SELECT category_id, main_image, a_plus_images FROM products WHERE id = %s",
+        (product_id,),
     )
     product = c.fetchone()
     if product["main_image"]:
@@ -299,8 +605,9 @@ def delete_product(product_id):
             flash(f"Could not delete A+ images from blob storage: {e}", "error")
 
     c.execute("DELETE FROM products WHERE id = %s", (product_id,))
+    refresh_collections(c, [product["category_id"]])
     conn.commit()
-    conn.close()
+    release_db_conn(conn)
     return redirect(url_for("admin", tab="products"))
 
 
@@ -311,7 +618,7 @@ def edit_product(product_id):
     c = conn.cursor()
     if request.method == "POST":
         c.execute(
-            "SELECT main_image, a_plus_images FROM products WHERE id = %s",
+            "SELECT category_id, main_image, a_plus_images FROM products WHERE id = %s",
             (product_id,),
         )
         product_data = c.fetchone()
@@ -366,15 +673,18 @@ def edit_product(product_id):
                 product_id,
             ),
         )
+        refresh_collections(
+            c, [product_data["category_id"], request.form.get("category_id")]
+        )
         conn.commit()
-        conn.close()
+        release_db_conn(conn)
         return redirect(url_for("admin"))
 
     c.execute("SELECT * FROM products WHERE id = %s", (product_id,))
     product = c.fetchone()
     c.execute("SELECT id, name_zh, name_en FROM categories")
     categories_list = c.fetchall()
-    conn.close()
+    release_db_conn(conn)
     a_plus_imgs = (
         product["a_plus_images"].split(",") if product["a_plus_images"] else []
     )
@@ -389,6 +699,8 @@ def edit_product(product_id):
 @app.route("/admin/edit_category/<int:cat_id>", methods=["GET", "POST"])
 @admin_required
 def edit_category(cat_id):
+    # 后台页面不使用可能过期的导航缓存
+    g.categories, g.settings = load_nav_cache(force=True)
     conn = get_db_conn()
     c = conn.cursor()
     c.execute("SELECT * FROM categories WHERE id = %s", (cat_id,))
@@ -427,15 +739,18 @@ def edit_category(cat_id):
             ),
         )
         conn.commit()
-        conn.close()
+        release_db_conn(conn)
+        invalidate_nav_cache()
         return redirect(url_for("admin", tab="categories"))
-    conn.close()
+    release_db_conn(conn)
     return render_template("edit_category.html", category=category)
 
 
 @app.route("/admin", methods=["GET", "POST"])
 @admin_required
 def admin():
+    # 设置表单与旧图片地址须取自数据库最新值，否则会写回过期设置、漏删 blob
+    g.categories, g.settings = load_nav_cache(force=True)
     conn = get_db_conn()
     c = conn.cursor()
 
@@ -548,6 +863,7 @@ def admin():
                     )
 
             conn.commit()
+            invalidate_nav_cache()
             return redirect(url_for("admin", tab="settings"))
 
         elif action == "ADD_PRODUCT":
@@ -587,6 +903,7 @@ def admin():
                     1 if request.form.get("is_featured") == "on" else 0,
                 ),
             )
+            refresh_collections(c, [request.form.get("category_id")])
             conn.commit()
             return redirect(url_for("admin", tab="products"))
 
@@ -609,6 +926,7 @@ def admin():
                 ),
             )
             conn.commit()
+            invalidate_nav_cache()
             return redirect(url_for("admin", tab="categories"))
 
         elif action == "ADD_FEEDBACK":
@@ -634,6 +952,7 @@ def admin():
                     img_url,
                 ),
             )
+            refresh_collections(c)
             conn.commit()
             return redirect(url_for("admin", tab="feedback"))
 
@@ -657,7 +976,7 @@ def admin():
     ]
 
     active_tab = request.args.get("tab", "products")
-    conn.close()
+    release_db_conn(conn)
     return render_template(
         "admin.html",
         orders=orders,
@@ -0,0 +1,127 @@
+# bench_startup.py
+# 冷启动基准：每次在全新子进程中测量 import app 耗时与首个请求的响应时间 (TTFB)
+#   baseline - 指定 git 版本的 app.py（如改动前的版本，启动时即导入全部依赖）
+#   eager    - 当前代码，默认模式
+#   fast     - 当前代码，PEACEPET_FAST_START=1
+# warm 表示先调用 warmup() 再发首个请求
+# 注意：与应用本身一样，会在目标数据库中建立并填充 collections 表，请使用测试库
+# 用法: POSTGRES_URL_NON_POOLING=... python bench_startup.py [次数] [baseline 版本]
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app as peacepet
+t1 = time.perf_counter()
+result = {
+    "import_ms": (t1 - t0) * 1000,
+    "heavy_modules": [m for m in ("psycopg2", "dotenv", "vercel_blob") if m in sys.modules],
+}
+if "--warm" in sys.argv:
+    t2 = time.perf_counter()
+    assert peacepet.warmup() is not False, "warmup failed"
+    result["warmup_ms"] = (time.perf_counter() - t2) * 1000
+client = peacepet.app.test_client()
+paths = [("first_home_ms", "/"), ("second_home_ms", "/")]
+if "--category" in sys.argv:
+    paths.append(("first_category_ms", "/catalog/" + sys.argv[sys.argv.index("--category") + 1]))
+for key, path in paths:
+    t3 = time.perf_counter()
+    resp = client.get(path)
+    result[key] = (time.perf_counter() - t3) * 1000
+    assert resp.status_code == 200, (path, resp.status_code)
+print(json.dumps(result))
+"""
+
+METRICS = (
+    "import_ms",
+    "warmup_ms",
+    "first_home_ms",
+    "second_home_ms",
+    "first_category_ms",
+)
+
+
+def first_category_slug():
+    import psycopg2
+
+    conn = psycopg2.connect(os.environ["POSTGRES_URL_NON_POOLING"])
+    c = conn.cursor()
+    c.execute("SELECT slug FROM categories ORDER BY sort_order DESC, id DESC LIMIT 1")
+    row = c.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+def run_probe(cwd, fast_start=False, warm=False, category=None):
+    env = dict(os.environ, PEACEPET_FAST_START="1" if fast_start else "0")
+    args = [sys.executable, "-c", PROBE] + (["--warm"] if warm else [])
+    if category:
+        args += ["--category", category]
+    out = subprocess.run(
+        args, env=env, cwd=cwd, capture_output=True, text=True, check=True
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def baseline_tree(rev):
+    # 把旧版 app.py 放到临时目录，模板与静态文件沿用当前目录
+    tmp = tempfile.mkdtemp(prefix="peacepet_baseline_")
+    source = subprocess.run(
+        ["git", "show", f"{rev}:app.py"],
+        cwd=HERE,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    with open(os.path.join(tmp, "app.py"), "w") as f:
+        f.write(source)
+    for name in ("templates", "static"):
+        os.symlink(os.path.join(HERE, name), os.path.join(tmp, name))
+    return tmp
+
+
+def report(label, results):
+    print(f"[{label}] runs={len(results)} loaded={results[0]['heavy_modules']}")
+    for key in METRICS:
+        if key in results[0]:
+            values = [r[key] for r in results]
+            print(
+                f"  {key:<18} median={statistics.median(values):8.1f}  "
+                f"min={min(values):8.1f}  max={max(values):8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    if not os.environ.get("POSTGRES_URL_NON_POOLING"):
+        sys.exit("POSTGRES_URL_NON_POOLING must point at a test database")
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    category = first_category_slug()  # 没有分类时跳过分类页
+    cases = [
+        ("eager cold", HERE, False, False),
+        ("eager warm", HERE, False, True),
+        ("fast cold", HERE, True, False),
+        ("fast warm", HERE, True, True),
+    ]
+    baseline = None
+    if len(sys.argv) > 2:
+        baseline = baseline_tree(sys.argv[2])
+        cases.insert(0, (f"baseline {sys.argv[2]}", baseline, False, False))
+    try:
+        for label, cwd, fast_start, warm in cases:
+            run_probe(cwd, fast_start, warm, category)  # 丢弃首次运行（磁盘缓存、建表）
+            report(
+                label,
+                [run_probe(cwd, fast_start, warm, category) for _ in range(runs)],
+            )
+    finally:
+        if baseline:
+            shutil.rmtree(baseline)
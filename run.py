@@ -1,9 +1,15 @@
 # run.py
 from waitress import serve
-from app import app
+from app import FAST_START, SERVER_THREADS, app, start_warmup, warmup
     
 # 生产环境，关闭 Debug 模式
 if __name__ == '__main__':
     print("PeacePet CMS 生产环境启动中...")
+    if FAST_START:
+        # 快速启动：先开始监听，预热在后台进行，完成前 /readyz 返回 503
+        start_warmup()
+    else:
+        # 预热完成后再开始接收请求
+        warmup()
     # waitress 是生产级服务器
-    serve(app, host='0.0.0.0', port=5000)
\ No newline at end of file
+    serve(app, host='0.0.0.0', port=5000, threads=SERVER_THREADS)
\ No newline at end of file